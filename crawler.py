@@ -1,35 +1,203 @@
+from collections import deque
+import csv
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from urllib.parse import urljoin, urlparse
 import logging
+import multiprocessing
+import os
+import re
+import socket
+import threading
+import time
 
-import pandas as pd
 import requests
-from bs4 import BeautifulSoup
+import requests_cache
+from lxml import etree
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# hrefs the _normalize string fast path cannot reproduce urljoin/urlparse for: path
+# params, dot segments, fragments, and the tab/newline/leading whitespace or control
+# characters urlsplit removes
+_SLOW_HREF_RE = re.compile(r"[;#\t\r\n]|/\.|^[\x00-\x20]")
+# urlsplit drops tab/newline anywhere and leading whitespace or control characters, so
+# " https://other.host/" would only look relative until urljoin resolves it off-site
+_HREF_REMOVE_TABLE = str.maketrans("", "", "\t\r\n")
+_HREF_LEADING_CHARS = "".join(map(chr, range(0x21)))
+
+_dns_cache = {}
+_dns_cache_lock = threading.Lock()
+_uncached_getaddrinfo = socket.getaddrinfo
+
+
+def install_dns_cache(ttl=300):
+    """Caches socket.getaddrinfo results so repeated connections skip DNS lookups.
+
+    The crawl targets a single host, so every new pooled connection would otherwise
+    resolve the same name again. Calling this more than once only updates the TTL.
+
+    Args:
+        ttl (int): number of seconds a resolved address is reused before expiring
+    """
+
+    def cached_getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
+        key = (host, port, family, type, proto, flags)
+        now = time.monotonic()
+        with _dns_cache_lock:
+            entry = _dns_cache.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        result = _uncached_getaddrinfo(host, port, family, type, proto, flags)
+        with _dns_cache_lock:
+            _dns_cache[key] = (now + ttl, result)
+        return result
+
+    socket.getaddrinfo = cached_getaddrinfo
+
+
+class _HrefCollector:
+    """lxml parser target that records anchor hrefs without building a document tree."""
+
+    def __init__(self):
+        self.hrefs = set()
+
+    def start(self, tag, attrib):
+        if tag == "a":
+            href = attrib.get("href")
+            if href:
+                # record the href as urljoin will read it, so the accept filter sees
+                # the same host the link resolves to
+                href = href.translate(_HREF_REMOVE_TABLE).lstrip(_HREF_LEADING_CHARS)
+                if href:
+                    self.hrefs.add(href)
+
+    def close(self):
+        return self.hrefs
+
+
+def _extract_hrefs(html_text):
+    """Extracts the href of every anchor in an HTML document in a single streaming pass.
+
+    Kept at module level so it can be shipped to a process pool.
+
+    Args:
+        html_text (str): The HTML document to scan.
+
+    Returns:
+        set: The unique non-empty href values found, or None if the document cannot be
+            parsed. lxml errors are not raised as they may not survive pickling.
+    """
+    if not html_text:
+        return set()
+    parser = etree.HTMLParser(target=_HrefCollector())
+    try:
+        parser.feed(html_text)
+        return parser.close()
+    except etree.LxmlError:
+        return None
 
 
 class RecursiveUrlFetcher:
     def __init__(
-        self, init_url, base_url, removal_strs, destination_dir, logger=None
+        self,
+        init_url,
+        base_url,
+        removal_strs,
+        destination_dir,
+        logger=None,
+        max_workers=20,
+        batch_size=32,
+        cache_name="crawl_cache",
+        pdf_queue=None,
     ) -> None:
         self.init_url = init_url
         self.base_url = base_url
-        self.removal_strs = removal_strs
+        parsed_base = urlparse(base_url)
+        self._base_prefix = f"{parsed_base.scheme}://{parsed_base.netloc}"
+        # accepts hrefs on the base host plus scheme-less relative hrefs, so off-site,
+        # mailto: and javascript: links are rejected before any URL parsing
+        self._accept_re = re.compile(
+            rf"(?:https?:)?//{re.escape(parsed_base.netloc)}(?:[/?]|$)"
+            r"|(?![a-z][a-z0-9+.-]*:|//)",
+            re.IGNORECASE,
+        )
+        self.removal_strs = tuple(removal_strs)
+        # one case-insensitive alternation instead of a substring scan per removal string;
+        # (?!) never matches, so an empty removal list keeps every URL
+        self._removal_re = re.compile(
+            "|".join(re.escape(substr) for substr in self.removal_strs) or "(?!)",
+            re.IGNORECASE,
+        )
         self.destination_dir = destination_dir
         self.logger = logger or logging.getLogger("__name__")
         self.url_list = [init_url]
-        self.traversed_url_list = []
-        self.all_pdf_links = []
-
-    def contains_any(self, string, substrings):
-        """Checks if any substring from a list is present in a given string.
+        self.traversed_urls = set()
+        # links already resolved or waiting in the frontier, so they are queued only once
+        self.enqueued_urls = set()
+        self.all_pdf_links = set()
+        # optional queue.Queue receiving each new PDF link as soon as it is found
+        self.pdf_queue = pdf_queue
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        # process pool parsing pages off the GIL, only alive while fetch_all_urls runs
+        self._parser_pool = None
+        self.session = self.requests_session(
+            pool_size=max_workers, cache_name=cache_name
+        )
+        install_dns_cache()
+
+    def requests_session(
+        self,
+        pool_size=20,
+        retries=3,
+        backoff_factor=0.3,
+        cache_name="crawl_cache",
+        expire_after=86400,
+    ):
+        """Creates a pooled request session reused across every crawl request.
 
         Args:
-            string (str): The string to search in.
-            substrings (list): A list of substrings to search for.
+            pool_size (int): number of keep-alive connections kept per host
+            retries (int): max number of retries attempts
+            backoff_factor (float): factor to apply exponential delay between retries
+            cache_name (str): name of the SQLite response cache so re-runs skip already
+                fetched pages, or None to always hit the network
+            expire_after (int): seconds a cached response is reused unless the server's
+                Cache-Control headers say otherwise
 
         Returns:
-            bool: True if any substring is found, False otherwise.
+            requests.Session: session with a keep-alive connection pool mounted
         """
-        return any(substr in string for substr in substrings)
+        if cache_name is None:
+            session = requests.Session()
+        else:
+            session = requests_cache.CachedSession(
+                cache_name,
+                backend="sqlite",
+                expire_after=expire_after,
+                allowable_methods=("GET", "HEAD"),
+                cache_control=True,
+            )
+        retry = Retry(
+            total=retries,
+            read=retries,
+            connect=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(500, 502, 503, 504),
+        )
+        # block instead of opening throwaway connections once every pooled one is busy,
+        # so concurrent workers keep sharing the same warm keep-alive connections
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=retry,
+            pool_block=True,
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers["Connection"] = "keep-alive"
+        return session
 
     def is_valid_url(self, check_url, timeout=5):
         """Checks if a given URL is valid and reachable.
@@ -45,7 +213,7 @@ class RecursiveUrlFetcher:
             Info: The status of the URL check.
         """
         try:
-            response = requests.head(check_url, timeout=timeout, allow_redirects=True)
+            response = self.session.head(check_url, timeout=timeout, allow_redirects=True)
             if response.status_code < 400:
                 self.logger.info(f"URL {check_url} is valid")
                 return True
@@ -56,147 +224,246 @@ class RecursiveUrlFetcher:
             self.logger.info(f"URL {check_url} could not be reached")
             return False
 
+    def _resolve_destination(self, url):
+        """Follows redirects for a URL and returns its normalized final destination.
+
+        A HEAD request is used so no response body is downloaded, falling back to a
+        streamed GET for servers that do not allow HEAD.
+
+        Args:
+            url (str): The URL to resolve.
+
+        Returns:
+            str: The destination URL without query parameters, or None on error.
+
+        Logs:
+            Info: Any errors encountered while accessing the URL.
+        """
+        try:
+            # only the final URL is needed, so skip the body transfer with a HEAD
+            response = self.session.head(url, allow_redirects=True, timeout=10)
+            if response.status_code in (405, 501):
+                # server refuses HEAD; stream the GET and drop it once headers arrive
+                response = self.session.get(
+                    url, allow_redirects=True, timeout=10, stream=True
+                )
+                response.close()
+        except requests.RequestException as e:
+            self.logger.info(f"Error accessing {url}: {e}")
+            return None
+        # Parse the URL to remove query parameters
+        parsed_url = urlparse(response.url)
+        return f"{parsed_url.scheme}://{parsed_url.netloc}{parsed_url.path}"
+
     def filter_unique_destinations(self, urls):
         """Filters out duplicate redirect URLs from a list of URLs.
 
+        Redirects are resolved concurrently using up to `max_workers` requests.
+
         Args:
             urls (list): A list of URLs to filter.
 
         Returns:
-            list: A list of unique destination URLs after following redirects.
+            set: The unique destination URLs after following redirects.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            destinations = executor.map(self._resolve_destination, urls)
+            return {url for url in destinations if url is not None}
 
-        Logs:
-            Info: Any errors encountered while accessing URLs.
+    def _normalize(self, href):
+        """Joins an href onto the base URL and strips its query parameters.
+
+        Root-relative and same-origin absolute hrefs are handled with plain string
+        operations; anything else (dot segments, path params, fragments, whitespace
+        urlsplit would strip, other origins, page relative links) falls back to
+        urljoin/urlparse.
+
+        Args:
+            href (str): The href to normalize, without a fragment.
+
+        Returns:
+            str: The normalized absolute URL.
         """
-        unique_destinations = []
+        if not _SLOW_HREF_RE.search(href):
+            if href.startswith("/") and not href.startswith("//"):
+                return self._base_prefix + href.split("?", 1)[0]
+            if href.startswith(self._base_prefix + "/"):
+                return href.split("?", 1)[0]
+        full_link = urlparse(urljoin(self.base_url, href))
+        return f"{full_link.scheme}://{full_link.netloc}{full_link.path}"
 
-        for url in urls:
+    def _parse_hrefs(self, html_text):
+        """Extracts anchor hrefs in the parser pool, or inline when no pool is usable.
+
+        Args:
+            html_text (str): The HTML document to scan.
+
+        Returns:
+            set: The unique non-empty href values found, or None if parsing failed.
+
+        Logs:
+            Warning: If a parser process died, after which pages are parsed inline.
+        """
+        pool = self._parser_pool
+        if pool is not None:
             try:
-                response = requests.get(url, allow_redirects=True, timeout=10)
-                final_url = response.url
+                return pool.submit(_extract_hrefs, html_text).result()
+            except BrokenProcessPool as e:
+                self.logger.warning(f"html parser pool broke, parsing inline: {e}")
+                self._parser_pool = None
+        return _extract_hrefs(html_text)
 
-                # Parse the URL to remove query parameters
-                parsed_url = urlparse(final_url)
-                normalized_url = (
-                    f"{parsed_url.scheme}://{parsed_url.netloc}{parsed_url.path}"
-                )
-                if normalized_url not in unique_destinations:
-                    unique_destinations.append(normalized_url)
-            except requests.RequestException as e:
-                self.logger.info(f"Error accessing {url}: {e}")
-        return unique_destinations
+    def _fetch_links(self, curr_url):
+        """Fetches a single page and extracts the normalized on-site links it contains.
 
-    def recursive_url_fetcher(self, urls):
-        """Recursively fetches and processes URLs to find all PDF-like links.
+        Args:
+            curr_url (str): The URL of the page to fetch.
 
-        This function traverses through the given URLs, extracts links from their HTML content,
-        and recursively processes these links. It identifies PDF links and adds them to a global list.
+        Returns:
+            list: Normalized URLs of the anchors found on the page, or the on-site
+                redirect target if the page redirects to another page.
+
+        Logs:
+            Info: Any errors encountered while accessing the page.
+        """
+        links = []
+        try:
+            # pages come from filter_unique_destinations and are already canonical,
+            # so a redirect is handed back to the frontier instead of followed inline
+            response = self.session.get(curr_url, allow_redirects=False, timeout=5)
+            if response.is_redirect:
+                location = urljoin(curr_url, response.headers["Location"])
+                if not self._accept_re.match(location):
+                    return links
+                target = self._normalize(location)
+                if target != curr_url:
+                    links.append(target)
+                    return links
+                # a query or ;param variant of the page itself normalizes back to
+                # curr_url, which is already traversed, so follow it here instead
+                response = self.session.get(curr_url, timeout=5)
+            if response.status_code == 200:
+                href_list = self._parse_hrefs(response.text)
+                if href_list is None:
+                    self.logger.warning(f"lxml html parsing failed for {curr_url}")
+                    return links
+                if len(href_list) > 0:
+                    # get the href link, append root and check if valid link before adding to links
+                    for link in href_list:
+                        # short circuiting and ignore fragments and irrelavant domains
+                        if "#" in link or not self._accept_re.match(link):
+                            continue
+                        links.append(self._normalize(link))
+        except requests.exceptions.HTTPError as e:
+            self.logger.info(f"HTTP Error: {e}")
+        except requests.exceptions.ConnectionError as e:
+            self.logger.info(f"Error Connecting: {e}")
+        except requests.exceptions.Timeout as e:
+            self.logger.info(f"Timeout Error: {e}")
+        except requests.exceptions.RequestException as e:
+            self.logger.info(f"Something went wrong: {e}")
+        return links
+
+    def _process_batch(self, urls):
+        """Fetches and processes a batch of URLs, collecting PDF-like links on the way.
+
+        URLs that were visited before or contain a removal string are pruned, PDF links
+        are recorded in `all_pdf_links`, and the remaining pages are fetched using up to
+        `max_workers` concurrent requests.
 
         Args:
             urls (list): A list of URLs to process.
 
-        Global Variables:
-            all_pdf_links (list): Stores all found PDF links.
-            traversed_url_list (list): Keeps track of all visited URLs.
-            REMOVAL_STRS (list): Strings used to filter out unwanted URLs.
-            BASE_URL (str): The base URL used for joining relative URLs.
+        Returns:
+            set: Unique destination URLs linked from the batch that are neither visited
+                nor already waiting in the frontier.
 
         Logs:
             Info: Various stages of the URL processing.
-
-        Note:
-            This function modifies global variables and doesn't return a value directly.
-            It recursively calls itself with new sets of URLs.
         """
         self.logger.info(f"Processing {len(urls)} URLs")
         self.logger.info(f"Total PDF links found: {len(self.all_pdf_links)}")
-        updated_link_set = []
-
-        if len(urls) <= 0:
-            # base case: empty list to iterate on direct return
-            return
-
-        # base case: prune urls that have been visited before or contain certain str
-
-        urls = set(
-            [
-                url
-                for url in urls
-                if not self.contains_any(url.lower(), self.removal_strs)
-            ]
-        )
-
-        urls = set([url for url in urls if url not in self.traversed_url_list])
+        updated_link_set = set()
+        page_urls = set()
 
         for url in urls:
-            # base case: list containing .pdf like files add to global and remove from all iterations going forward
-            if url.lower().endswith(".pdf"):
-                if url not in self.all_pdf_links:
-                    self.logger.info(f"pdf {url} has been added")
-                    self.all_pdf_links.append(url)
-
-        urls = set([url for url in urls if url not in self.all_pdf_links])
-
-        for curr_url in urls:
-            if curr_url in self.traversed_url_list:
+            # prune urls that have been visited before or contain certain str
+            if (
+                url in self.traversed_urls
+                or url in self.all_pdf_links
+                or self._removal_re.search(url)
+            ):
                 continue
-            else:
-                self.traversed_url_list.append(curr_url)
-                try:
-                    # get html and convert to soup
-                    response = requests.get(curr_url, allow_redirects=True, timeout=5)
-                    if response.status_code == 200:
-                        try:
-                            soup = BeautifulSoup(response.text, "html.parser")
-                        except AttributeError as e:
-                            self.logger.warning(
-                                f"bs4 html parsing exception occurred: {e}"
-                            )
-                        # get all acnhors contain hrefs
-                        anchor_list = soup.find_all("a")
-                        if len(anchor_list) > 0:
-                            href_list = set(
-                                [anchor.get("href") for anchor in anchor_list]
-                            )
-                            # get the href link, append root and check if valid link before adding to updated_link_list
-                            for link in href_list:
-                                if link and "#" not in link:
-                                    full_link = urljoin(self.base_url, link)
-                                    full_link = urlparse(full_link)
-                                    normalized_url = f"{full_link.scheme}://{full_link.netloc}{full_link.path}"
-                                    # short circuiting and ignore irrelavant domains without
-                                    # substring www.cncbinternational.com
-                                    if (
-                                        "www.cncbinternational.com"
-                                        in str(normalized_url)
-                                        and str(normalized_url)
-                                        not in self.traversed_url_list
-                                    ):
-                                        updated_link_set.append(normalized_url)
-                except requests.exceptions.HTTPError as e:
-                    self.logger.info(f"HTTP Error: {e}")
-                except requests.exceptions.ConnectionError as e:
-                    self.logger.info(f"Error Connecting: {e}")
-                except requests.exceptions.Timeout as e:
-                    self.logger.info(f"Timeout Error: {e}")
-                except requests.exceptions.RequestException as e:
-                    self.logger.info(f"Something went wrong: {e}")
-
-        # recursive case
-        uniq_dest_url_list = self.filter_unique_destinations(
-            list(set(updated_link_set))
-        )
+            # .pdf like files are added to global and removed from all iterations going forward
+            if url[-4:].lower() == ".pdf":
+                self.logger.info(f"pdf {url} has been added")
+                self.all_pdf_links.add(url)
+                if self.pdf_queue is not None:
+                    self.pdf_queue.put(url)
+                continue
+            page_urls.add(url)
+
+        # fetch every page of this batch concurrently, marking them as traversed up front
+        self.traversed_urls.update(page_urls)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for links in executor.map(self._fetch_links, page_urls):
+                updated_link_set.update(
+                    link
+                    for link in links
+                    if link not in self.traversed_urls
+                    and link not in self.enqueued_urls
+                )
 
-        self.recursive_url_fetcher(list(set(uniq_dest_url_list)))
+        destinations = self.filter_unique_destinations(updated_link_set)
+        new_urls = {
+            url
+            for url in destinations
+            if url not in self.traversed_urls and url not in self.enqueued_urls
+        }
+        self.enqueued_urls.update(updated_link_set)
+        self.enqueued_urls.update(new_urls)
+        return new_urls
 
     def fetch_all_urls(self):
-        """Initiates the URL fetching process."""
-        self.recursive_url_fetcher(self.url_list)
+        """Crawls breadth-first from the initial URL until no unvisited links remain.
 
-    def save_results(self):
-        """Saves the results to Excel files."""
-        pdf_df = pd.DataFrame({"pdf_link": self.all_pdf_links})
-        traversed_df = pd.DataFrame({"traversed_link": self.traversed_url_list})
+        The frontier is drained iteratively in batches of `batch_size` URLs, so crawl depth
+        is not bounded by the recursion limit and each batch's pages are freed once processed.
+        Pages are parsed in a process pool so parsing runs in parallel with the fetches.
+        """
+        frontier = deque(self.url_list)
+        self.enqueued_urls.update(self.url_list)
+        # fork would copy a process with fetch and download threads running, so start
+        # workers from a clean forkserver where the platform has one
+        start_method = (
+            "forkserver"
+            if "forkserver" in multiprocessing.get_all_start_methods()
+            else "spawn"
+        )
+        pool = ProcessPoolExecutor(
+            max_workers=os.cpu_count(),
+            mp_context=multiprocessing.get_context(start_method),
+        )
+        self._parser_pool = pool
+        try:
+            while frontier:
+                batch = [
+                    frontier.popleft()
+                    for _ in range(min(len(frontier), self.batch_size))
+                ]
+                frontier.extend(self._process_batch(batch))
+        finally:
+            self._parser_pool = None
+            pool.shutdown()
 
-        pdf_df.to_excel("pdf_links.xlsx", index=False)
-        traversed_df.to_excel("traversed_links.xlsx", index=False)
+    def save_results(self):
+        """Saves the results to CSV files."""
+        with open("pdf_links.csv", "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["pdf_link"])
+            writer.writerows([link] for link in sorted(self.all_pdf_links))
+
+        with open("traversed_links.csv", "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["traversed_link"])
+            writer.writerows([link] for link in sorted(self.traversed_urls))
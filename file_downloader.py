@@ -1,21 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from urllib.parse import urlsplit
+import email.utils
+import http.client
+import itertools
+import mmap
 import os
+import queue
 import re
+import threading
 import requests
+import urllib3
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+# bodies at least this large with a known size are written through a memory map
+MMAP_MIN_SIZE = 256 * 1024
+# \Z rather than $ so a trailing newline is not accepted as part of a valid name
+PDF_FILENAME_RE = re.compile(r"^[a-zA-Z0-9_-]+\.pdf\Z")
+# "bytes first-last/total" on a 206, "bytes */total" on a 416
+CONTENT_RANGE_RE = re.compile(r"^bytes\s+(?:(\d+)-\d+|\*)/(\d+|\*)$")
+
 
 class FileDownloader:
-    def __init__(self, destination, logger):
+    def __init__(self, destination, logger, max_concurrency=8):
         """
         Initializes the FileDownloader with a destination directory.
 
         Args:
-            destination (str): The destination directory where files will be saved.
+            destination (str | os.PathLike): The destination directory where files will be saved.
             logger (logging.Logger): logger instance to record file download status.
+            max_concurrency (int): max number of files downloaded concurrently, also the
+                number of keep-alive connections pooled per host
         """
-        self.destination = destination
+        self.destination = Path(destination)
         self.logger = logger
+        self.max_concurrency = max_concurrency
+        # one reusable copy buffer per download thread, see _write_buffered
+        self._buffers = threading.local()
+        # 429/503 are retried with exponential backoff, waiting out Retry-After when sent
+        self.session = self.requests_retry_session(
+            retries=5,
+            backoff_factor=1,
+            status_forcelist=(429, 500, 502, 503, 504),
+            pool_size=max_concurrency,
+        )
 
     def requests_retry_session(
         self,
@@ -23,6 +52,7 @@ class FileDownloader:
         backoff_factor=0.3,
         status_forcelist=(500, 502, 503, 504),
         session=None,
+        pool_size=10,
     ):
         """
         Creates a request session object to automatically retry HTTP requests with user defined behaviour
@@ -32,6 +62,7 @@ class FileDownloader:
             backoff_factor (float): factor to apply exponential delay between retries
             status_forcelist (Tuple[int]): HTTP status codes that should trigger a retry
             session (requests.Session): an optional request.Session to be provided for reconfiguration
+            pool_size (int): number of keep-alive connections kept per host
         """
         session = session or requests.Session()
         retry = Retry(
@@ -40,19 +71,83 @@ class FileDownloader:
             connect=retries,
             backoff_factor=backoff_factor,
             status_forcelist=status_forcelist,
+            respect_retry_after_header=True,
+        )
+        # block rather than open throwaway connections once every pooled one is busy
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=retry,
+            pool_block=True,
         )
-        adapter = HTTPAdapter(max_retries=retry)
         session.mount("http://", adapter)
         session.mount("https://", adapter)
         return session
 
-    def download_file(self, url, filename):
+    def content_length(self, response):
+        """
+        Reads the Content-Length header of a response.
+
+        Args:
+            response (requests.Response): the response to read the header from.
+
+        Returns:
+            int: the body size in bytes, or 0 if the header is missing or malformed.
+        """
+        try:
+            return max(int(response.headers.get("Content-Length", 0)), 0)
+        except ValueError:
+            return 0
+
+    def content_range(self, response):
+        """
+        Reads the Content-Range header of a response.
+
+        Args:
+            response (requests.Response): the response to read the header from.
+
+        Returns:
+            Tuple[int, int]: the first byte and the complete size, each None if the
+                header omits it or is missing or malformed.
+        """
+        match = CONTENT_RANGE_RE.match(response.headers.get("Content-Range", "").strip())
+        if match is None:
+            return None, None
+        first, total = match.groups()
+        return (
+            int(first) if first is not None else None,
+            int(total) if total != "*" else None,
+        )
+
+    def _stamp_last_modified(self, filename, response):
+        """
+        Sets the file's mtime to the response's Last-Modified date.
+
+        A later resume sends this mtime back as If-Range, so the server only continues
+        the file when its copy is still the version the local prefix came from.
+
+        Args:
+            filename (str | os.PathLike): the downloaded file.
+            response (requests.Response): the response the file was written from.
+        """
+        try:
+            modified = email.utils.parsedate_to_datetime(
+                response.headers["Last-Modified"]
+            ).timestamp()
+        except (KeyError, TypeError, ValueError):
+            # no usable validator, the write time will never match an If-Range
+            return
+        os.utime(filename, (modified, modified))
+
+    def download_file(self, url, filename, resume=False):
         """
         Downloads a file from the given URL to the specified filename.
 
         Args:
             url (str): The URL of the file to download.
-            filename (str): The path where the file will be saved.
+            filename (str | os.PathLike): The path where the file will be saved.
+            resume (bool): continue a partial download left next to filename with a Range
+                request instead of downloading the whole file again
 
         Returns:
             bool: True if the download was successful, False otherwise.
@@ -60,32 +155,252 @@ class FileDownloader:
         Raises:
             requests.RequestException: If there's an error during the download process.
         """
+        # the body is written to a .part file that only replaces filename once complete,
+        # so an interrupted download never leaves a full size file with a zeroed tail
+        part = f"{filename}.part"
+        start = os.path.getsize(part) if resume and os.path.exists(part) else 0
+        # PDFs barely compress, so skip the decoder and keep Content-Length the on-disk size
+        headers = {"Accept-Encoding": "identity"}
+        if start:
+            headers["Range"] = f"bytes={start}-"
+            # the server only honours the range while its file still has the Last-Modified
+            # stamped on the partial copy, otherwise it sends the whole new version
+            headers["If-Range"] = email.utils.formatdate(
+                os.path.getmtime(part), usegmt=True
+            )
         try:
-            session = self.requests_retry_session()
-            response = session.get(url, stream=True, timeout=10)
-            response.raise_for_status()
+            # Close the streamed response on every path so its connection returns to the pool
+            with self.session.get(
+                url, stream=True, timeout=10, headers=headers
+            ) as response:
+                if start and response.status_code == 416:
+                    if self.content_range(response)[1] == start:
+                        # nothing past the local size, the partial file is already whole
+                        os.replace(part, filename)
+                        self.logger.info("File already downloaded: %s", filename)
+                        return True
+                    # the local file is larger than the server's, download it again
+                    response.close()
+                    return self.download_file(url, filename)
+                response.raise_for_status()
+                if response.status_code != 206:
+                    # the server ignored the Range header and sent the whole file
+                    start = 0
+                elif self.content_range(response)[0] != start:
+                    # not the range that was asked for, so it cannot be appended
+                    response.close()
+                    return self.download_file(url, filename)
+                size = self.content_length(response)
 
-            # Open the file in binary write mode
-            with open(filename, "wb") as file:
-                # Iterate over the response data in chunks
-                for chunk in response.iter_content(chunk_size=(1024**2) * 10):
-                    # Write each chunk to the file
-                    file.write(chunk)
+                # Content-Length is only the on-disk size when the body is not encoded
+                encoding = response.headers.get("Content-Encoding", "identity")
+                identity = encoding == "identity"
+                if start and not identity:
+                    # an encoded range cannot be appended after decoding, start over
+                    response.close()
+                    return self.download_file(url, filename)
+                # Let urllib3 undo any gzip/deflate transfer encoding while copying
+                response.raw.decode_content = True
+
+                flags = os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0)
+                # read access too, since a shared writable mmap requires it
+                fd = os.open(part, flags if start else flags | os.O_TRUNC, 0o666)
+                preallocated = False
+                if size > 0 and hasattr(os, "posix_fallocate"):
+                    # Reserve the whole file up front so the filesystem can lay it out contiguously
+                    try:
+                        os.posix_fallocate(fd, start, size)
+                        preallocated = True
+                    except OSError:
+                        # preallocation is only a hint, e.g. unsupported on this filesystem
+                        pass
+                source = self._body_source(response, identity)
+                # a mapping over unreserved blocks raises SIGBUS for the whole process when
+                # the disk fills, so only map files whose blocks are already allocated
+                try:
+                    if preallocated and identity and size >= MMAP_MIN_SIZE:
+                        written = self._write_mapped(source, fd, start, size)
+                    else:
+                        written = self._write_buffered(source, fd, start)
+                    if source is not response.raw and source.isclosed():
+                        # urllib3 only hands the connection back to its pool after its own
+                        # reads, so return it once the body underneath has been drained
+                        response.raw.release_conn()
+                finally:
+                    # also stamp partial files, they are what a later resume continues
+                    self._stamp_last_modified(part, response)
+
+            if identity and 0 < size != written:
+                # the .part file is kept, a later run resumes from its end
+                self.logger.info("File download incomplete: %s", filename)
+                return False
 
             # Check if the file exists and has content
-            if os.path.exists(filename) and os.path.getsize(filename) > 0:
-                self.logger.info(f"File downloaded successfully: {filename}")
+            if os.path.exists(part) and os.path.getsize(part) > 0:
+                os.replace(part, filename)
+                self.logger.info("File downloaded successfully: %s", filename)
                 return True
-            self.logger.info(f"File download failed or file is empty: {filename}")
+            self.logger.info("File download failed or file is empty: %s", filename)
             return False
 
-        except requests.RequestException as e:
-            self.logger.info(f"Error downloading file: {e}")
+        except (
+            requests.RequestException,
+            urllib3.exceptions.HTTPError,
+            # raised unwrapped by bodies read past urllib3, see _body_source
+            http.client.HTTPException,
+            ConnectionError,
+            TimeoutError,
+        ) as e:
+            self.logger.info("Error downloading file: %s", e)
             return False
         except IOError as e:
-            self.logger.info(f"Error writing file: {e}")
+            self.logger.info("Error writing file: %s", e)
             return False
 
+    def _body_source(self, response, identity):
+        """
+        Picks the stream a response body is read from.
+
+        urllib3's readinto() reads a new bytes object per call and copies it into the
+        buffer. An unencoded body has nothing to decode, so it is read from the http.client
+        response underneath instead, whose readinto() fills the buffer from the socket.
+
+        Args:
+            response (requests.Response): streamed response to read the body from.
+            identity (bool): True if the body is sent without a Content-Encoding.
+
+        Returns:
+            file-like: object whose readinto() fills a buffer with the body.
+        """
+        original = getattr(response.raw, "_original_response", None)
+        if identity and original is not None:
+            return original
+        # an encoded body still goes through urllib3 to be decoded
+        return response.raw
+
+    def _write_mapped(self, source, fd, start, size):
+        """
+        Reads a response body of known size directly into a memory map of the file.
+
+        Args:
+            source (file-like): stream to read the body from, see _body_source.
+            fd (int): file descriptor of the target file, closed before returning.
+            start (int): file offset the body is written at.
+            size (int): expected body size in bytes.
+
+        Returns:
+            int: number of bytes written, the file is truncated to end after them.
+        """
+        written = 0
+        try:
+            os.ftruncate(fd, start + size)
+            with mmap.mmap(fd, start + size, access=mmap.ACCESS_WRITE) as mm:
+                with memoryview(mm) as view:
+                    while written < size:
+                        offset = start + written
+                        # a named slice is released even when the read raises, an unnamed
+                        # one stays exported from the traceback and the map cannot close
+                        with view[offset : offset + min(1 << 16, size - written)] as chunk:
+                            n = source.readinto(chunk)
+                        if not n:
+                            break
+                        written += n
+            # no msync here, the kernel writes the dirty pages back on its own
+        finally:
+            # cut the unfilled tail on every exit, a failed read included, so the file
+            # ends at the last byte received and a resume continues from there
+            if written < size:
+                os.ftruncate(fd, start + written)
+            os.close(fd)
+        return written
+
+    def _write_buffered(self, source, fd, start):
+        """
+        Copies a response body into the file in large chunks.
+
+        Args:
+            source (file-like): stream to read the body from, see _body_source.
+            fd (int): file descriptor of the target file, closed before returning.
+            start (int): file offset the body is written at.
+
+        Returns:
+            int: number of bytes written.
+        """
+        view = getattr(self._buffers, "view", None)
+        if view is None:
+            view = self._buffers.view = memoryview(bytearray(1 << 20))
+        # Copy in 1 MiB chunks through this thread's buffer, larger than the default file
+        # buffer so each one is handed straight to a single write without another copy
+        with os.fdopen(fd, "wb") as file:
+            file.seek(start)
+            try:
+                while n := source.readinto(view):
+                    file.write(view[:n])
+            finally:
+                # Drop any preallocated tail a short, decoded or failed body did not fill
+                file.truncate()
+            return file.tell() - start
+
+    def is_complete_file(self, url, filename):
+        """
+        Checks if a previously downloaded file is complete using a HEAD preflight.
+
+        Args:
+            url (str): The URL the file was downloaded from.
+            filename (str | os.PathLike): The path of the local file.
+
+        Returns:
+            bool: True if the file exists and matches the server reported Content-Length,
+                or the server reports no size to compare against, False otherwise.
+        """
+        if not os.path.exists(filename) or os.path.getsize(filename) == 0:
+            return False
+        try:
+            # same encoding as the download, so Content-Length is comparable to the file size
+            response = self.session.head(
+                url,
+                allow_redirects=True,
+                timeout=5,
+                headers={"Accept-Encoding": "identity"},
+            )
+        except requests.RequestException as e:
+            self.logger.info("Error checking file %s, keeping it: %s", filename, e)
+            return True
+        expected = self.content_length(response)
+        return expected == 0 or os.path.getsize(filename) == expected
+
+    def download_missing_file(self, url, filename):
+        """
+        Downloads a file unless a complete copy already exists at the specified filename,
+        resuming from the end of a partial copy when the server supports it.
+
+        Args:
+            url (str): The URL of the file to download.
+            filename (str | os.PathLike): The path where the file will be saved.
+
+        Returns:
+            bool: True if the file is complete on disk afterwards, False otherwise.
+        """
+        if self.is_complete_file(url, filename):
+            self.logger.info("File already downloaded: %s", filename)
+            return True
+        return self.download_file(url, filename, resume=True)
+
+    def url_key(self, url):
+        """
+        Normalizes a URL for duplicate detection.
+
+        Args:
+            url (str): The URL to normalize.
+
+        Returns:
+            str: The URL without its fragment and with a lowercase scheme and host.
+        """
+        parts = urlsplit(url)
+        return parts._replace(
+            scheme=parts.scheme.lower(), netloc=parts.netloc.lower(), fragment=""
+        ).geturl()
+
     def validate_pdf_filename(self, filename):
         """
         Validates if the given filename is correctly formatted for a PDF file.
@@ -96,48 +411,89 @@ class FileDownloader:
         Returns:
             bool: True if the filename is valid, False otherwise.
         """
-        pattern = r"^[a-zA-Z0-9_-]+\.pdf$"
-        return bool(re.match(pattern, filename))
+        return PDF_FILENAME_RE.match(filename) is not None
 
     def download_all_files(self, file_url_arr):
         """
         Downloads all files from the given array of URLs to the specified destination.
 
         Args:
-            file_url_arr (list): A list of URLs pointing to files to be downloaded.
+            file_url_arr (Iterable[str]): URLs pointing to files to be downloaded. May be
+                a lazy iterator such as a queue being filled by the crawler, downloads
+                start as soon as each URL arrives.
 
-        Returns:
-            list: A list of dictionaries containing information about each download attempt.
+        Yields:
+            dict: Information about each download attempt as soon as it completes,
+                    so callers can stream results without the downloader holding them.
                     Each dictionary includes:
                     - 'original_url': The original URL of the file.
                     - 'file_name': The name of the file (either original or generated).
                     - 'dl_status': A boolean indicating if the download was successful.
         """
-        f_name_cnt = 0
-        result_json = []
-        for file_idx, file_url in enumerate(file_url_arr):
-            self.logger.info(f"running {file_url}")
-            self.logger.info(file_idx)
-            entry = {}
-            f_name = file_url.split("/")[-1]
-
-            if os.path.exists(f"pdf_files/{f_name}"):
-                # edge case; only run set on full URL path fails to catch duplicate pdf_file names
-                # we will assume that the files are identical as they have the same name
-                continue
-
-            if not self.validate_pdf_filename(f_name):
-                f_name = f"tmp_fn_{f_name_cnt}.pdf"
-                f_name_cnt += 1
-            entry = {
-                "original_url": file_url,
-                "file_name": f_name,
-            }
-            full_path = f"{self.destination}/{f_name}"
-            if self.download_file(file_url, full_path):
-                entry["dl_status"] = True
-            else:
-                entry["dl_status"] = False
-            result_json.append(entry)
-            self.logger.info(f"completed {file_url}")
-        return result_json
+        f_name_cnt = itertools.count()
+        # names claimed by downloads still in flight, which are not on disk yet
+        claimed_names = set()
+        validate_pdf_filename = self.validate_pdf_filename
+        seen_urls = set()
+        done = queue.SimpleQueue()
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            futures = {}
+            for file_idx, file_url in enumerate(file_url_arr):
+                # the same PDF is often linked from several pages, fetch it only once
+                key = self.url_key(file_url)
+                if key in seen_urls:
+                    continue
+                seen_urls.add(key)
+
+                self.logger.info("running %s", file_url)
+                self.logger.info(file_idx)
+                f_name = file_url.rpartition("/")[2]
+
+                if f_name in claimed_names:
+                    # edge case; only run set on full URL path fails to catch duplicate pdf_file names
+                    # we will assume that the files are identical as they have the same name
+                    continue
+
+                if validate_pdf_filename(f_name):
+                    # a file left by a previous run is only kept if its size is complete
+                    download = self.download_missing_file
+                else:
+                    f_name = f"tmp_fn_{next(f_name_cnt)}.pdf"
+                    download = self.download_file
+                claimed_names.add(f_name)
+                entry = {
+                    "original_url": file_url,
+                    "file_name": f_name,
+                }
+                full_path = self.destination / f_name
+                future = executor.submit(download, file_url, full_path)
+                futures[future] = entry
+                future.add_done_callback(done.put)
+
+                # hand back downloads that finished while file_url_arr produced more URLs
+                while not done.empty():
+                    yield self._completed_entry(done.get(), futures)
+
+            for future in as_completed(list(futures)):
+                yield self._completed_entry(future, futures)
+
+    def _completed_entry(self, future, futures):
+        """
+        Records the outcome of a finished download on its result entry.
+
+        Args:
+            future (concurrent.futures.Future): the finished download_file call.
+            futures (dict): pending futures mapped to their entries, the future is removed.
+
+        Returns:
+            dict: the result entry with 'dl_status' set.
+        """
+        entry = futures.pop(future)
+        try:
+            entry["dl_status"] = future.result()
+        except Exception:
+            # a bug in one download only fails that file, but keep its traceback
+            self.logger.exception("Error downloading %s", entry["original_url"])
+            entry["dl_status"] = False
+        self.logger.info("completed %s", entry["original_url"])
+        return entry
@@ -1,5 +1,8 @@
 import logging
-import json
+import logging.handlers
+import queue
+import threading
+import orjson
 import pandas as pd
 from crawler import RecursiveUrlFetcher
 from file_downloader import FileDownloader
@@ -8,7 +11,9 @@ if __name__ == "__main__":
     logger = logging.getLogger(__name__)
     logger.setLevel(logging.INFO)
 
-    file_handler = logging.FileHandler("app.log")
+    logger.propagate = False
+
+    file_handler = logging.FileHandler("app.log", delay=True)
     file_handler.setLevel(logging.INFO)
 
     formatter = logging.Formatter(
@@ -16,48 +21,66 @@ if __name__ == "__main__":
     )
     file_handler.setFormatter(formatter)
 
-    logger.addHandler(file_handler)
+    # batch records in memory and write them to app.log 1024 at a time, or right away
+    # on errors; the remainder is flushed by logging.shutdown at exit
+    memory_handler = logging.handlers.MemoryHandler(
+        capacity=1024, flushLevel=logging.ERROR, target=file_handler
+    )
+    logger.addHandler(memory_handler)
 
     INIT_URL = "https://www.cncbinternational.com/home/en/index.jsp"
     BASE_URL = "https://www.cncbinternational.com"
     REMOVAL_STRS = ["fragment", "tc/", "sc/", ".doc", ".jpg", ".png", ".apk"]
     DESTINATION_DIR = "pdf_files"
 
+    # PDF links flow from the crawler to the downloader as they are discovered,
+    # so downloads overlap the crawl instead of waiting for it to finish
+    pdf_queue = queue.Queue()
     fetcher = RecursiveUrlFetcher(
-        INIT_URL, BASE_URL, REMOVAL_STRS, DESTINATION_DIR, logger
+        INIT_URL, BASE_URL, REMOVAL_STRS, DESTINATION_DIR, logger, pdf_queue=pdf_queue
     )
-    fetcher.fetch_all_urls()
-    fetcher.save_results()
 
-    pdf_df = pd.read_excel("pdf_links.xlsx")
+    def crawl():
+        try:
+            fetcher.fetch_all_urls()
+        finally:
+            # sentinel ending the downloader's input once the crawl is done
+            pdf_queue.put(None)
 
-    print(f"Total PDF links found: {len(pdf_df)}")
+    crawl_thread = threading.Thread(target=crawl, name="crawler")
+    crawl_thread.start()
 
     downloader = FileDownloader(DESTINATION_DIR, logger)
 
-    results = downloader.download_all_files(pdf_df["pdf_link"])
-
-    DL_FNAME = "result_dl.json"
+    DL_FNAME = "result_dl.jsonl"
 
+    # only successful downloads are kept in memory, every result is streamed to disk
+    downloaded = []
     try:
-        with open(DL_FNAME, "w", encoding="utf-8") as f:
-            json.dump(results, f, ensure_ascii=False, indent=4)
+        with open(DL_FNAME, "wb") as f:
+            for entry in downloader.download_all_files(iter(pdf_queue.get, None)):
+                f.write(orjson.dumps(entry) + b"\n")
+                if entry["dl_status"]:
+                    downloaded.append(entry)
         print(f"Data successfully saved to {DL_FNAME}")
     except IOError as e:
         print(f"Error saving data to JSON: {e}")
 
-    with open("result_dl.json", "r", encoding="utf-8") as result:
-        result_json = json.load(result)
+    crawl_thread.join()
+    fetcher.save_results()
+
+    print(f"Total PDF links found: {len(fetcher.all_pdf_links)}")
 
-    result_df = pd.read_json("result_dl.json", orient="records")
-    result_df = result_df[result_df["dl_status"]]
-    result_df = result_df.rename(
-        columns={"original_url": "link", "file_name": "filename"}
+    # build the metadata frame once from the successful downloads, no reparse or copies
+    result_df = pd.DataFrame.from_records(
+        downloaded, columns=["original_url", "file_name"]
+    )
+    result_df.rename(
+        columns={"original_url": "link", "file_name": "filename"}, inplace=True
     )
     result_df["file_display_name"] = result_df["filename"]
     result_df["last_updated"] = "15-07-2024"
-    result_df = result_df.drop(columns=["dl_status"])
     result_dict_arr = result_df.to_dict(orient="records")
 
-    with open("danswer_metadata.json", "w", encoding="utf-8") as f_handle:
-        json.dump(result_dict_arr, f_handle)
+    with open("danswer_metadata.json", "wb") as f_handle:
+        f_handle.write(orjson.dumps(result_dict_arr))